@@ -3,6 +3,11 @@ import sys
 import hashlib
 import json
 import time
+import mmap
+import struct
+import bisect
+from collections import namedtuple
+from contextlib import contextmanager
 from prettytable import PrettyTable
 from rich.console import Console
 from rich.tree import Tree
@@ -20,7 +25,7 @@ def init():
     # Create necessary directories
     os.makedirs(os.path.join(VCS_DIR, "objects"), exist_ok=True)
     os.makedirs(os.path.join(VCS_DIR, "commits"), exist_ok=True)
-    open(os.path.join(VCS_DIR, "index"), "w").close()
+    write_index([])
 
     # Set HEAD to point to the default branch (main)
     default_branch = "main"
@@ -53,6 +58,205 @@ def hash_file(filepath):
         f.write(content)
     return sha
 
+# Index layout (all integers little-endian):
+#   header:     magic "MYIX", version, entry count, path table size
+#   entries:    fixed-size records sorted by path, see INDEX_ENTRY
+#   path table: the entry paths, concatenated
+#   extensions: optional (signature, length, payload) blocks, e.g. "TREE"
+INDEX_MAGIC = b"MYIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sIII")
+# path offset, path length, flags, mode, size, mtime (ns), sha1
+INDEX_ENTRY = struct.Struct("<IHHIQq20s")
+INDEX_EXT_HEADER = struct.Struct("<4sI")
+TREE_EXT = b"TREE"
+
+class BadIndexError(Exception):
+    pass
+
+IndexEntry = namedtuple("IndexEntry", ["path", "mode", "size", "mtime_ns", "sha"])
+
+def index_entry_for(filepath):
+    st = os.stat(filepath)
+    sha = hash_file(filepath)
+    return IndexEntry(filepath, st.st_mode, st.st_size, st.st_mtime_ns, sha)
+
+def compute_tree_hash(entries):
+    h = hashlib.sha1()
+    for entry in entries:
+        h.update(os.fsencode(entry.path) + b"\0" + entry.sha.encode() + b"\n")
+    return h.hexdigest()
+
+def _replace_index(chunks):
+    # Written to a temp file and swapped in so a reader never sees a
+    # half-written index
+    index_path = os.path.join(VCS_DIR, "index")
+    tmp_path = index_path + ".lock"
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, index_path)
+
+def write_index(entries):
+    # Full rewrite from decoded entries, used by init and the legacy upgrade
+    entries = sorted(entries, key=lambda e: os.fsencode(e.path))
+    records = []
+    paths = bytearray()
+    for entry in entries:
+        raw_path = os.fsencode(entry.path)
+        records.append(INDEX_ENTRY.pack(
+            len(paths), len(raw_path), 0, entry.mode, entry.size,
+            entry.mtime_ns, bytes.fromhex(entry.sha)
+        ))
+        paths += raw_path
+
+    _replace_index([
+        INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(entries), len(paths)),
+        b"".join(records),
+        bytes(paths),
+    ])
+
+def upgrade_index():
+    # Older repos store the index as a newline-separated list of paths.
+    # Every path is kept, and the entries are left blank (no stat data, no
+    # hash) so the next commit hashes them instead of this read doing it.
+    index_path = os.path.join(VCS_DIR, "index")
+    with open(index_path, "rb") as f:
+        files = set(os.fsdecode(line) for line in f.read().splitlines() if line)
+    write_index([IndexEntry(p, 0, 0, 0, "00" * 20) for p in files])
+
+@contextmanager
+def open_index(write=False):
+    # Yields the index mapped into memory, or None if it is missing or empty.
+    # Nothing is parsed up front; entries are decoded on demand.
+    index_path = os.path.join(VCS_DIR, "index")
+    if not os.path.exists(index_path) or os.path.getsize(index_path) == 0:
+        yield None
+        return
+    with open(index_path, "r+b" if write else "rb") as f:
+        access = mmap.ACCESS_WRITE if write else mmap.ACCESS_READ
+        with mmap.mmap(f.fileno(), 0, access=access) as mm:
+            if mm[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+                if len(mm) < INDEX_HEADER.size:
+                    raise BadIndexError(f"Index file {index_path} is truncated.")
+                version = INDEX_HEADER.unpack_from(mm, 0)[1]
+                if version != INDEX_VERSION:
+                    raise BadIndexError(f"Unsupported index version {version} in {index_path}.")
+                yield mm
+                return
+    upgrade_index()
+    with open_index(write) as mm:
+        yield mm
+
+def index_count(mm):
+    return INDEX_HEADER.unpack_from(mm, 0)[2]
+
+def _index_paths_offset(mm):
+    return INDEX_HEADER.size + index_count(mm) * INDEX_ENTRY.size
+
+def _index_ext_offset(mm):
+    return _index_paths_offset(mm) + INDEX_HEADER.unpack_from(mm, 0)[3]
+
+def index_raw_path(mm, i):
+    off, length = INDEX_ENTRY.unpack_from(mm, INDEX_HEADER.size + i * INDEX_ENTRY.size)[:2]
+    start = _index_paths_offset(mm) + off
+    return mm[start:start + length]
+
+def index_entry(mm, i):
+    _, _, _, mode, size, mtime_ns, sha = INDEX_ENTRY.unpack_from(
+        mm, INDEX_HEADER.size + i * INDEX_ENTRY.size
+    )
+    return IndexEntry(os.fsdecode(index_raw_path(mm, i)), mode, size, mtime_ns, sha.hex())
+
+def iter_index(mm):
+    for i in range(index_count(mm)):
+        yield index_entry(mm, i)
+
+class _IndexPaths:
+    # Sequence view over the sorted paths so bisect can search the mmap directly
+    def __init__(self, mm):
+        self.mm = mm
+
+    def __len__(self):
+        return index_count(self.mm)
+
+    def __getitem__(self, i):
+        return index_raw_path(self.mm, i)
+
+def find_index_entry(mm, filepath):
+    # Returns (position, found); if not found, position is where it would go
+    raw_path = os.fsencode(filepath)
+    paths = _IndexPaths(mm)
+    i = bisect.bisect_left(paths, raw_path)
+    return i, i < len(paths) and paths[i] == raw_path
+
+def splice_index_entry(mm, i, entry):
+    # Returns the index with a new entry spliced in at position i, without
+    # decoding the others. The new path goes at the end of the path table, so
+    # existing path offsets stay valid. Any TREE extension is dropped since
+    # the tree has changed.
+    raw_path = os.fsencode(entry.path)
+    _, _, count, paths_size = INDEX_HEADER.unpack_from(mm, 0)
+    split = INDEX_HEADER.size + i * INDEX_ENTRY.size
+    ext_offset = _index_ext_offset(mm)
+    record = INDEX_ENTRY.pack(
+        paths_size, len(raw_path), 0, entry.mode, entry.size,
+        entry.mtime_ns, bytes.fromhex(entry.sha)
+    )
+    return [
+        INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, count + 1, paths_size + len(raw_path)),
+        mm[INDEX_HEADER.size:split],
+        record,
+        mm[split:ext_offset],
+        raw_path,
+    ]
+
+def update_index_entry(mm, i, entry):
+    # In-place update of an existing entry; the path itself never changes
+    off, length, flags = INDEX_ENTRY.unpack_from(mm, INDEX_HEADER.size + i * INDEX_ENTRY.size)[:3]
+    INDEX_ENTRY.pack_into(
+        mm, INDEX_HEADER.size + i * INDEX_ENTRY.size,
+        off, length, flags, entry.mode, entry.size, entry.mtime_ns, bytes.fromhex(entry.sha)
+    )
+
+def read_tree_extension(mm):
+    pos = _index_ext_offset(mm)
+    while pos + INDEX_EXT_HEADER.size <= len(mm):
+        sig, length = INDEX_EXT_HEADER.unpack_from(mm, pos)
+        pos += INDEX_EXT_HEADER.size
+        if sig == TREE_EXT:
+            return mm[pos:pos + length].hex()
+        pos += length
+    return None
+
+def write_tree_extension(tree_hash):
+    # Extensions sit after the path table, so replacing one is a truncate + append
+    with open_index() as mm:
+        if mm is None:
+            return
+        ext_offset = _index_ext_offset(mm)
+    with open(os.path.join(VCS_DIR, "index"), "r+b") as f:
+        f.truncate(ext_offset)
+        f.seek(ext_offset)
+        if tree_hash:
+            f.write(INDEX_EXT_HEADER.pack(TREE_EXT, 20))
+            f.write(bytes.fromhex(tree_hash))
+
+def is_entry_stale(entry, st, index_mtime_ns):
+    if (st.st_mode, st.st_size, st.st_mtime_ns) != (entry.mode, entry.size, entry.mtime_ns):
+        return True
+    # A file written in the same tick as the index may have changed without
+    # its stat data changing, so it has to be re-hashed to be sure
+    if entry.mtime_ns >= index_mtime_ns:
+        return True
+    return not os.path.exists(os.path.join(VCS_DIR, "objects", entry.sha))
+
+def read_index_paths():
+    with open_index() as mm:
+        if mm is None:
+            return []
+        return [e.path for e in iter_index(mm)]
+
 def is_repo_initialized():
     print("Checking repo initialization...")
 
@@ -110,33 +314,74 @@ def add(filename):
         print("Error: No repository initialized. Run 'init' first.")
         return
 
-    index_path = os.path.join(VCS_DIR, "index")
     if not os.path.exists(filename):
         print(f"File {filename} does not exist.")
         return
-    files = set()
-    if os.path.exists(index_path):
-        with open(index_path) as f:
-            files = set(f.read().splitlines())
-    files.add(filename)
-    with open(index_path, "w") as f:
-        for fpath in sorted(files):
-            f.write(fpath + "\n")
+    entry = index_entry_for(filename)
+    changed = False
+    spliced = None
+    try:
+        with open_index(write=True) as mm:
+            empty = mm is None
+            if not empty:
+                pos, found = find_index_entry(mm, filename)
+                if not found:
+                    spliced = splice_index_entry(mm, pos, entry)
+                else:
+                    old_entry = index_entry(mm, pos)
+                    if old_entry != entry:
+                        update_index_entry(mm, pos, entry)
+                    changed = old_entry.sha != entry.sha
+    except BadIndexError as e:
+        print(e)
+        return
+    if empty:
+        write_index([entry])
+    elif spliced:
+        _replace_index(spliced)
+    elif changed:
+        write_tree_extension(None)
     print(f"Added {filename} to index.")
 
 def commit(message):
-    with open(os.path.join(VCS_DIR, "index")) as f:
-        files = f.read().splitlines()
     tree = {}
-    for file in files:
-        if os.path.exists(file):
-            blob_hash = hash_file(file)
-            tree[file] = blob_hash
+    tree_entries = []
+    changed = False
+    complete = True
+    index_mtime_ns = os.stat(os.path.join(VCS_DIR, "index")).st_mtime_ns
+    try:
+        with open_index(write=True) as mm:
+            cached_tree_hash = read_tree_extension(mm) if mm is not None else None
+            for i in range(index_count(mm) if mm is not None else 0):
+                entry = index_entry(mm, i)
+                if not os.path.exists(entry.path):
+                    complete = False
+                    continue
+                # Only re-hash files whose stat data no longer matches the index
+                if is_entry_stale(entry, os.stat(entry.path), index_mtime_ns):
+                    fresh = index_entry_for(entry.path)
+                    if fresh != entry:
+                        update_index_entry(mm, i, fresh)
+                        changed = changed or fresh.sha != entry.sha
+                    entry = fresh
+                tree[entry.path] = entry.sha
+                tree_entries.append(entry)
+    except BadIndexError as e:
+        print(e)
+        return
+    # The TREE extension only ever caches the hash of the full index, so a
+    # tree that leaves out missing files is hashed but never cached
+    if complete and not changed and cached_tree_hash:
+        tree_hash = cached_tree_hash
+    else:
+        tree_hash = compute_tree_hash(tree_entries)
+        write_tree_extension(tree_hash if complete else None)
     commit_id = hashlib.sha1((message + str(time.time())).encode()).hexdigest()
     metadata = {
         "message": message,
         "timestamp": time.ctime(),
-        "tree": tree
+        "tree": tree,
+        "tree_hash": tree_hash
     }
     with open(os.path.join(VCS_DIR, "commits", commit_id), "w") as f:
         json.dump(metadata, f, indent=2)
@@ -427,8 +672,11 @@ def status():
     if not os.path.exists(index_path):
         print("Repository not initialized.")
         return
-    with open(index_path) as f:
-        files = f.read().splitlines()
+    try:
+        files = read_index_paths()
+    except BadIndexError as e:
+        print(e)
+        return
     print("Tracked files:")
     for file in files:
         print("  " + file)
@@ -483,10 +731,13 @@ def show_config():
         table.field_names = ["Tracked Files"]
 
         if os.path.exists(index_path):
-            with open(index_path) as f:
-                files = f.read().splitlines()
-                for file in files:
-                    table.add_row([file])  # Add each file as a row
+            try:
+                files = read_index_paths()
+            except BadIndexError as e:
+                print(e)
+                return
+            for file in files:
+                table.add_row([file])  # Add each file as a row
 
             print("\nTracked Files:")
             print(table)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("builtins.input", lambda *_: "test")
+    main.init()
+    return tmp_path
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def sha(content):
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def last_commit():
+    with open(os.path.join(main.VCS_DIR, "commits", main.get_current_commit())) as f:
+        return json.load(f)
+
+
+def test_add_keeps_entries_sorted_and_searchable(repo):
+    for name in ["c.txt", "a.txt", "b.txt"]:
+        write(name, name)
+        main.add(name)
+    assert main.read_index_paths() == ["a.txt", "b.txt", "c.txt"]
+    with main.open_index() as mm:
+        assert main.find_index_entry(mm, "b.txt") == (1, True)
+        assert main.find_index_entry(mm, "bb.txt") == (2, False)
+        assert main.index_entry(mm, 2).sha == sha("c.txt")
+
+
+def test_readd_updates_entry_in_place(repo):
+    write("a.txt", "one")
+    main.add("a.txt")
+    index_path = os.path.join(main.VCS_DIR, "index")
+    inode = os.stat(index_path).st_ino
+    write("a.txt", "two")
+    main.add("a.txt")
+    assert os.stat(index_path).st_ino == inode
+    with main.open_index() as mm:
+        assert main.index_entry(mm, 0).sha == sha("two")
+
+
+def test_legacy_index_is_upgraded_without_losing_paths(repo):
+    write("a.txt", "a")
+    write(os.path.join(main.VCS_DIR, "index"), "a.txt\ngone.txt\n")
+    assert main.read_index_paths() == ["a.txt", "gone.txt"]
+    assert os.listdir(os.path.join(main.VCS_DIR, "objects")) == []
+    main.commit("upgrade")
+    assert last_commit()["tree"] == {"a.txt": sha("a")}
+
+
+def test_commit_rehashes_racily_clean_entries(repo):
+    write("a.txt", "aaaa")
+    main.add("a.txt")
+    with main.open_index() as mm:
+        mtime_ns = main.index_entry(mm, 0).mtime_ns
+    index_path = os.path.join(main.VCS_DIR, "index")
+
+    # Same size and mtime, index written well after: the stat data is trusted
+    write("a.txt", "bbbb")
+    os.utime("a.txt", ns=(mtime_ns, mtime_ns))
+    os.utime(index_path, ns=(mtime_ns + 10**10, mtime_ns + 10**10))
+    main.commit("trusted")
+    assert last_commit()["tree"] == {"a.txt": sha("aaaa")}
+
+    # Index written in the same tick as the file: it has to be re-hashed
+    os.utime(index_path, ns=(mtime_ns, mtime_ns))
+    main.commit("racy")
+    assert last_commit()["tree"] == {"a.txt": sha("bbbb")}
+
+
+def test_tree_hash_follows_deleted_and_restored_files(repo):
+    write("a.txt", "a")
+    write("b.txt", "b")
+    main.add("a.txt")
+    main.add("b.txt")
+    main.commit("both")
+    full = last_commit()["tree_hash"]
+    with main.open_index() as mm:
+        assert main.read_tree_extension(mm) == full
+
+    os.remove("a.txt")
+    main.commit("only b")
+    assert last_commit()["tree_hash"] != full
+    with main.open_index() as mm:
+        assert main.read_tree_extension(mm) is None
+
+    write("a.txt", "a")
+    main.commit("both again")
+    assert last_commit()["tree"] == {"a.txt": sha("a"), "b.txt": sha("b")}
+    assert last_commit()["tree_hash"] == full
+
+
+@pytest.mark.parametrize("content", [
+    b"MYIX",
+    main.INDEX_HEADER.pack(main.INDEX_MAGIC, main.INDEX_VERSION + 1, 0, 0),
+])
+def test_bad_index_is_reported(repo, capsys, content):
+    index_path = os.path.join(main.VCS_DIR, "index")
+    with open(index_path, "wb") as f:
+        f.write(content)
+    write("a.txt", "a")
+    main.add("a.txt")
+    main.commit("nope")
+    main.status()
+    assert capsys.readouterr().out.count(index_path) == 3
+    with open(index_path, "rb") as f:
+        assert f.read() == content
+    assert main.get_current_commit() == ""